@@ -20,7 +20,7 @@ class Settings:
     spreadsheet_id: Optional[str]
     spreadsheet_title: str
     worksheet_name: str
-    watch_chat_ids: Optional[Set[int]]
+    watch_chat_ids: Optional[frozenset[int]]
     log_level: str
     log_file: Optional[Path]
     log_max_bytes: int
@@ -42,7 +42,7 @@ def _require_env(name: str) -> str:
     return value
 
 
-def _parse_chat_ids(raw: str | None) -> Optional[Set[int]]:
+def _parse_chat_ids(raw: str | None) -> Optional[frozenset[int]]:
     if not raw:
         return None
     chat_ids: Set[int] = set()
@@ -56,7 +56,7 @@ def _parse_chat_ids(raw: str | None) -> Optional[Set[int]]:
             raise ConfigError(
                 f"Invalid chat id '{chunk}' in WATCH_CHAT_IDS. Use integers."
             ) from exc
-    return chat_ids or None
+    return frozenset(chat_ids) if chat_ids else None
 
 
 def _parse_positive_int(
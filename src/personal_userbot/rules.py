@@ -4,12 +4,39 @@ from __future__ import annotations
 
 import json
 import logging
-from dataclasses import dataclass
+import os
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Iterable, List, Optional, Sequence, Set
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+try:  # pragma: no cover - optional dependency
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+try:  # pragma: no cover - optional dependency
+    import orjson
+except ImportError:
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
+# Parsed rules per file, keyed by (path, mtime_ns, size) so repeated loads
+# of an unchanged file skip the JSON parse and Rule validation entirely.
+_PARSE_CACHE: Dict[Tuple[str, int, int], Tuple[Rule, ...]] = {}
+
+# Rules added via the append-only log are folded back into the canonical
+# file once the log grows past this many entries.
+_LOG_COMPACT_THRESHOLD = 64
+
+# Hash-consing for chat id sets: rules scoped to the same chats share one
+# frozenset instance instead of allocating identical sets per rule.
+_CHAT_SET_INTERN: Dict[frozenset, frozenset] = {}
+
+
+def _intern_chat_ids(chat_ids: frozenset) -> frozenset:
+    return _CHAT_SET_INTERN.setdefault(chat_ids, chat_ids)
+
 
 @dataclass(frozen=True)
 class Rule:
@@ -19,7 +46,69 @@ class Rule:
     include_all: Sequence[str]
     include_any: Sequence[str]
     exclude: Sequence[str]
-    chat_ids: Optional[Set[int]]
+    chat_ids: Optional[frozenset[int]]
+    # Casefolded twins of the keyword fields, computed once at construction so
+    # the per-message hot path never re-normalizes static keyword strings.
+    include_all_cf: Tuple[str, ...] = field(
+        init=False, repr=False, compare=False, default=()
+    )
+    include_any_cf: Tuple[str, ...] = field(
+        init=False, repr=False, compare=False, default=()
+    )
+    exclude_cf: Tuple[str, ...] = field(
+        init=False, repr=False, compare=False, default=()
+    )
+    # Set views of the casefolded keywords, used for the hit-set checks of
+    # the automaton-based matcher.
+    include_all_cf_set: frozenset = field(
+        init=False, repr=False, compare=False, default=frozenset()
+    )
+    include_any_cf_set: frozenset = field(
+        init=False, repr=False, compare=False, default=frozenset()
+    )
+    exclude_cf_set: frozenset = field(
+        init=False, repr=False, compare=False, default=frozenset()
+    )
+    # include_all + include_any concatenated once, original alongside the
+    # casefolded form, for matched-keyword extraction.
+    all_keywords: Tuple[str, ...] = field(
+        init=False, repr=False, compare=False, default=()
+    )
+    all_keywords_cf: Tuple[str, ...] = field(
+        init=False, repr=False, compare=False, default=()
+    )
+
+    def __post_init__(self) -> None:
+        if self.chat_ids is not None:
+            object.__setattr__(
+                self, "chat_ids", _intern_chat_ids(frozenset(self.chat_ids))
+            )
+        object.__setattr__(
+            self,
+            "include_all_cf",
+            tuple(keyword.casefold() for keyword in self.include_all),
+        )
+        object.__setattr__(
+            self,
+            "include_any_cf",
+            tuple(keyword.casefold() for keyword in self.include_any),
+        )
+        object.__setattr__(
+            self,
+            "exclude_cf",
+            tuple(keyword.casefold() for keyword in self.exclude),
+        )
+        object.__setattr__(self, "include_all_cf_set", frozenset(self.include_all_cf))
+        object.__setattr__(self, "include_any_cf_set", frozenset(self.include_any_cf))
+        object.__setattr__(self, "exclude_cf_set", frozenset(self.exclude_cf))
+        object.__setattr__(
+            self,
+            "all_keywords",
+            tuple(self.include_all) + tuple(self.include_any),
+        )
+        object.__setattr__(
+            self, "all_keywords_cf", self.include_all_cf + self.include_any_cf
+        )
 
     def applies_to_chat(self, chat_id: int | None) -> bool:
         if chat_id is None or self.chat_ids is None:
@@ -32,7 +121,7 @@ class RuleSet:
 
     def __init__(self, rules: Iterable[Rule]) -> None:
         self._rules: List[Rule] = list(rules)
-        self._rebuild_chat_cache()
+        self._rebuild_indexes()
 
     @property
     def rules(self) -> Sequence[Rule]:
@@ -46,42 +135,180 @@ class RuleSet:
         self._rules.append(rule)
         if rule.chat_ids:
             self._chat_ids.update(rule.chat_ids)
+        self._index_rule(len(self._rules) - 1, rule)
+        self._rebuild_automaton()
+        self._rebuild_first_chars()
+        self._rebuild_matcher()
 
     def replace(self, rules: Iterable[Rule]) -> None:
         self._rules = list(rules)
-        self._rebuild_chat_cache()
+        self._rebuild_indexes()
 
-    def _rebuild_chat_cache(self) -> None:
+    def _rebuild_indexes(self) -> None:
         chat_ids: Set[int] = set()
-        for rule in self._rules:
+        self._by_chat: Dict[int, List[int]] = {}
+        self._global: List[int] = []
+        for index, rule in enumerate(self._rules):
             if rule.chat_ids:
                 chat_ids.update(rule.chat_ids)
+            self._index_rule(index, rule)
         self._chat_ids = chat_ids
+        self._rebuild_automaton()
+        self._rebuild_first_chars()
+        self._rebuild_matcher()
+
+    def _rebuild_matcher(self) -> None:
+        """Generate a specialized matcher function for the current rules.
+
+        Every rule becomes straight-line code with its casefolded keywords
+        inlined as string constants, so the fallback match path runs plain
+        `in` opcodes without per-rule attribute lookups or all()/any()
+        machinery. Returns the indexes of matching rules.
+        """
+        lines = ["def _matcher(chat_id, normalized):", "    hits = []"]
+        env: Dict[str, object] = {}
+        for index, rule in enumerate(self._rules):
+            conditions: List[str] = []
+            if rule.chat_ids is not None:
+                env[f"_chats{index}"] = rule.chat_ids
+                conditions.append(
+                    f"(chat_id is None or chat_id in _chats{index})"
+                )
+            conditions.extend(
+                f"{keyword!r} in normalized" for keyword in rule.include_all_cf
+            )
+            if rule.include_any_cf:
+                conditions.append(
+                    "("
+                    + " or ".join(
+                        f"{keyword!r} in normalized"
+                        for keyword in rule.include_any_cf
+                    )
+                    + ")"
+                )
+            conditions.extend(
+                f"{keyword!r} not in normalized" for keyword in rule.exclude_cf
+            )
+            lines.append(f"    if {' and '.join(conditions) or 'True'}:")
+            lines.append(f"        hits.append({index})")
+        lines.append("    return hits")
+        exec(compile("\n".join(lines), "<rules-matcher>", "exec"), env)
+        self._matcher = env["_matcher"]
+
+    def _rebuild_first_chars(self) -> None:
+        # First casefolded character of every keyword. A message whose text
+        # shares no character with this set cannot contain any keyword, so
+        # match() can reject it with a single C-level disjointness test.
+        self._first_chars = frozenset(
+            keyword[0]
+            for rule in self._rules
+            for keyword in rule.include_all_cf + rule.include_any_cf
+            if keyword
+        )
 
-    def match(self, chat_id: int | None, text: str) -> List[Rule]:
-        """Return rules that match the provided message text."""
-        normalized = (text or "").casefold()
-        matches: List[Rule] = []
+    def _index_rule(self, index: int, rule: Rule) -> None:
+        if rule.chat_ids is None:
+            self._global.append(index)
+            return
+        for chat_id in rule.chat_ids:
+            self._by_chat.setdefault(chat_id, []).append(index)
+
+    def _candidates(self, chat_id: int | None) -> Sequence[Rule]:
+        """Return only the rules that can apply to this chat.
+
+        Rules scoped to other chats are skipped without even a per-rule
+        applies_to_chat call. Buckets hold rule indexes so the combined
+        view keeps definition order, matching the generated matcher.
+        """
+        rules = self._rules
+        if chat_id is None:
+            return rules
+        scoped = self._by_chat.get(chat_id)
+        if not scoped:
+            return [rules[index] for index in self._global]
+        if not self._global:
+            return [rules[index] for index in scoped]
+        # Both buckets are already in increasing index order, so Timsort
+        # merges the two runs in linear time.
+        return [rules[index] for index in sorted(self._global + scoped)]
+
+    def _rebuild_automaton(self) -> None:
+        """Compile all casefolded keywords into one multi-pattern automaton.
+
+        One C-level pass over the message then yields every keyword hit at
+        once, instead of a Python-level substring test per keyword per rule.
+        Stays None when pyahocorasick is not installed; match() falls back
+        to the substring loop.
+        """
+        self._automaton = None
+        if ahocorasick is None:
+            return
+        automaton = ahocorasick.Automaton()
         for rule in self._rules:
-            if not rule.applies_to_chat(chat_id):
-                continue
+            for keyword in rule.include_all_cf + rule.include_any_cf + rule.exclude_cf:
+                automaton.add_word(keyword, keyword)
+        if not len(automaton):
+            return
+        automaton.make_automaton()
+        self._automaton = automaton
+
+    def match(
+        self,
+        chat_id: int | None,
+        text: str,
+        *,
+        normalized: Optional[str] = None,
+    ) -> List[Tuple[Rule, List[str]]]:
+        """Return (rule, matched keywords) pairs for the message text.
+
+        Matched keywords are extracted here, while the casefolded text is
+        still in a local, so callers never re-normalize the message body.
+        Callers that already hold the casefolded text can pass it via
+        `normalized` to skip the internal casefold.
+        """
+        if normalized is None:
+            normalized = (text or "").casefold()
+        if self._first_chars and self._first_chars.isdisjoint(normalized):
+            return []
+        if self._automaton is not None:
+            return self._match_with_automaton(chat_id, normalized)
+
+        matches: List[Tuple[Rule, List[str]]] = []
+        for index in self._matcher(chat_id, normalized):
+            rule = self._rules[index]
+            matched = [
+                keyword
+                for keyword, keyword_cf in zip(
+                    rule.all_keywords, rule.all_keywords_cf
+                )
+                if keyword_cf in normalized
+            ]
+            matches.append((rule, matched))
+        return matches
 
-            if rule.include_all and not all(
-                keyword.casefold() in normalized for keyword in rule.include_all
-            ):
+    def _match_with_automaton(
+        self, chat_id: int | None, normalized: str
+    ) -> List[Tuple[Rule, List[str]]]:
+        """Evaluate rules against the hit set of a single automaton scan."""
+        hits = {keyword for _, keyword in self._automaton.iter(normalized)}
+        matches: List[Tuple[Rule, List[str]]] = []
+        if not hits:
+            return matches
+        for rule in self._candidates(chat_id):
+            if not rule.include_all_cf_set <= hits:
                 continue
-
-            if rule.include_any and not any(
-                keyword.casefold() in normalized for keyword in rule.include_any
-            ):
+            if rule.include_any_cf_set and rule.include_any_cf_set.isdisjoint(hits):
                 continue
-
-            if rule.exclude and any(
-                keyword.casefold() in normalized for keyword in rule.exclude
-            ):
+            if not rule.exclude_cf_set.isdisjoint(hits):
                 continue
-
-            matches.append(rule)
+            matched = [
+                keyword
+                for keyword, keyword_cf in zip(
+                    rule.all_keywords, rule.all_keywords_cf
+                )
+                if keyword_cf in hits
+            ]
+            matches.append((rule, matched))
         return matches
 
 
@@ -95,7 +322,7 @@ def _ensure_list(value, *, field: str, label: str) -> List[str]:
     raise ValueError(f"Field '{field}' for rule '{label}' must be a string or list.")
 
 
-def _parse_chat_ids(value, label: str) -> Optional[Set[int]]:
+def _parse_chat_ids(value, label: str) -> Optional[frozenset[int]]:
     if value is None:
         return None
     if not isinstance(value, (list, tuple, set)):
@@ -110,11 +337,47 @@ def _parse_chat_ids(value, label: str) -> Optional[Set[int]]:
             raise ValueError(
                 f"Invalid chat id '{item}' for rule '{label}'."
             ) from exc
-    return chat_ids or None
+    return _intern_chat_ids(frozenset(chat_ids)) if chat_ids else None
+
+
+def _rules_log_path(path: Path) -> Path:
+    return path.with_name(path.name + ".log")
+
+
+def _load_log_rules(path: Path) -> List[Rule]:
+    """Replay rules appended to the sidecar log since the last compaction."""
+
+    log_path = _rules_log_path(path)
+    if not log_path.exists():
+        return []
+    try:
+        lines = log_path.read_bytes().splitlines()
+    except OSError as exc:
+        logger.warning("Tidak bisa membaca log rules '%s': %s", log_path, exc)
+        return []
+
+    rules: List[Rule] = []
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            raw = orjson.loads(line) if orjson is not None else json.loads(line)
+            rules.append(_parse_rule(raw))
+        except (ValueError, RuntimeError) as exc:
+            logger.warning(
+                "Entri log rules tidak valid di '%s', dilewati: %s", log_path, exc
+            )
+    if rules:
+        logger.info("Replayed %d rules dari log %s", len(rules), log_path)
+    return rules
 
 
 def load_rules(path: Path) -> RuleSet:
-    """Load rules definition from a JSON file. Returns empty set if missing."""
+    """Load rules definition from a JSON file. Returns empty set if missing.
+
+    Rules appended via the sidecar log (see append_rule_log) are replayed
+    on top of the canonical file.
+    """
 
     logger.info("Loading rules from %s", path)
     if not path.exists():
@@ -122,20 +385,29 @@ def load_rules(path: Path) -> RuleSet:
             "Rules file '%s' tidak ditemukan. Memulai dengan rule set kosong.",
             path,
         )
-        return RuleSet([])
+        return RuleSet(_load_log_rules(path))
 
     try:
-        raw_text = path.read_text(encoding="utf-8")
+        stat = path.stat()
+        raw_bytes = path.read_bytes()
     except OSError as exc:
         raise RuntimeError(f"Tidak bisa membaca file rules '{path}': {exc}") from exc
 
-    if not raw_text.strip():
+    cache_key = (str(path), stat.st_mtime_ns, stat.st_size)
+    cached = _PARSE_CACHE.get(cache_key)
+    if cached is not None:
+        return RuleSet(list(cached) + _load_log_rules(path))
+
+    if not raw_bytes.strip():
         logger.info("Rules file '%s' kosong. Memulai dengan rule set kosong.", path)
-        return RuleSet([])
+        return RuleSet(_load_log_rules(path))
 
     try:
-        data = json.loads(raw_text)
-    except json.JSONDecodeError as exc:
+        if orjson is not None:
+            data = orjson.loads(raw_bytes)
+        else:
+            data = json.loads(raw_bytes)
+    except ValueError as exc:
         raise RuntimeError(
             f"Rules file '{path}' tidak valid. Periksa format JSON: {exc}"
         ) from exc
@@ -152,72 +424,104 @@ def load_rules(path: Path) -> RuleSet:
     if not isinstance(raw_rules, list):
         raise RuntimeError(f"Field 'rules' pada '{path}' harus berupa list.")
 
-    rules: List[Rule] = []
-    for raw in raw_rules:
-        if not isinstance(raw, dict):
-            raise RuntimeError("Setiap rule harus berbentuk objek dengan key-value.")
-        label = str(raw.get("label") or raw.get("name") or "").strip()
-        if not label:
-            raise RuntimeError("Setiap rule wajib memiliki field 'label'.")
-
-        include_all = _ensure_list(
-            raw.get("include_all") or raw.get("include"), field="include_all", label=label
-        )
-        include_any = _ensure_list(
-            raw.get("include_any"), field="include_any", label=label
-        )
-        exclude = _ensure_list(
-            raw.get("exclude"), field="exclude", label=label
+    rules: List[Rule] = [_parse_rule(raw) for raw in raw_rules]
+
+    logger.info("Loaded %d rules", len(rules))
+    _PARSE_CACHE[cache_key] = tuple(rules)
+    return RuleSet(rules + _load_log_rules(path))
+
+
+def _parse_rule(raw) -> Rule:
+    if not isinstance(raw, dict):
+        raise RuntimeError("Setiap rule harus berbentuk objek dengan key-value.")
+    label = str(raw.get("label") or raw.get("name") or "").strip()
+    if not label:
+        raise RuntimeError("Setiap rule wajib memiliki field 'label'.")
+
+    include_all = _ensure_list(
+        raw.get("include_all") or raw.get("include"), field="include_all", label=label
+    )
+    include_any = _ensure_list(
+        raw.get("include_any"), field="include_any", label=label
+    )
+    exclude = _ensure_list(
+        raw.get("exclude"), field="exclude", label=label
+    )
+    chat_ids = _parse_chat_ids(raw.get("chats"), label)
+
+    if not include_all and not include_any:
+        raise RuntimeError(
+            f"Rule '{label}' perlu setidaknya satu keyword via "
+            "'include_all' atau 'include_any'."
         )
-        chat_ids = _parse_chat_ids(raw.get("chats"), label)
 
-        if not include_all and not include_any:
-            raise RuntimeError(
-                f"Rule '{label}' perlu setidaknya satu keyword via "
-                "'include_all' atau 'include_any'."
-            )
+    return Rule(
+        label=label,
+        include_all=include_all,
+        include_any=include_any,
+        exclude=exclude,
+        chat_ids=chat_ids,
+    )
 
-        rules.append(
-            Rule(
-                label=label,
-                include_all=include_all,
-                include_any=include_any,
-                exclude=exclude,
-                chat_ids=chat_ids,
-            )
-        )
 
-    logger.info("Loaded %d rules", len(rules))
-    return RuleSet(rules)
+def _serialize_rule(rule: Rule) -> Dict[str, object]:
+    entry: Dict[str, object] = {
+        "label": rule.label,
+        "include_all": list(rule.include_all),
+        "include_any": list(rule.include_any),
+        "exclude": list(rule.exclude),
+    }
+    if rule.chat_ids:
+        entry["chats"] = sorted(rule.chat_ids)
+    return entry
 
 
 def save_rules(path: Path, rules: Sequence[Rule]) -> None:
-    """Persist rules to disk as JSON."""
-
-    serialized = []
-    for rule in rules:
-        entry = {
-            "label": rule.label,
-            "include_all": list(rule.include_all),
-            "include_any": list(rule.include_any),
-            "exclude": list(rule.exclude),
-        }
-        if rule.chat_ids:
-            entry["chats"] = sorted(rule.chat_ids)
-        serialized.append(entry)
+    """Persist rules to disk as JSON (atomic write, clears the sidecar log)."""
 
+    serialized = [_serialize_rule(rule) for rule in rules]
     payload = {"rules": serialized}
     path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+    if orjson is not None:
+        raw = orjson.dumps(payload, option=orjson.OPT_INDENT_2)
+    else:
+        raw = json.dumps(payload, indent=2).encode("utf-8")
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_bytes(raw)
+    os.replace(tmp_path, path)
+    _rules_log_path(path).unlink(missing_ok=True)
     logger.info("Saved %d rules to %s", len(serialized), path)
 
 
+def append_rule_log(path: Path, rule: Rule) -> None:
+    """Append a single rule to the sidecar log.
+
+    An O(1) append instead of re-serializing the whole rules file; the log
+    is folded back into the canonical file by save_rules.
+    """
+
+    log_path = _rules_log_path(path)
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    entry = _serialize_rule(rule)
+    if orjson is not None:
+        line = orjson.dumps(entry)
+    else:
+        line = json.dumps(entry).encode("utf-8")
+    with open(log_path, "ab") as handle:
+        handle.write(line + b"\n")
+
+
 class RuleRepository:
     """Helper to load, cache, and persist rules."""
 
     def __init__(self, path: Path) -> None:
         self._path = path
         self._ruleset = load_rules(path)
+        self._log_entries = 0
+        if _rules_log_path(path).exists():
+            # Fold log entries left over from a previous run back into the
+            # canonical file.
+            save_rules(path, self._ruleset.rules)
 
     @property
     def path(self) -> Path:
@@ -229,8 +533,13 @@ class RuleRepository:
 
     def add_rule(self, rule: Rule) -> None:
         self._ruleset.add_rule(rule)
-        save_rules(self._path, self._ruleset.rules)
+        append_rule_log(self._path, rule)
+        self._log_entries += 1
+        if self._log_entries >= _LOG_COMPACT_THRESHOLD:
+            save_rules(self._path, self._ruleset.rules)
+            self._log_entries = 0
 
     def replace(self, rules: Iterable[Rule]) -> None:
         self._ruleset.replace(rules)
         save_rules(self._path, self._ruleset.rules)
+        self._log_entries = 0
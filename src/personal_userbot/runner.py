@@ -5,14 +5,22 @@ from __future__ import annotations
 import asyncio
 from dataclasses import dataclass, field
 from datetime import datetime
+from functools import lru_cache
 from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 import json
 import logging
 from logging.handlers import RotatingFileHandler
+import os
 from pathlib import Path
 import re
 import sys
-from typing import Any, Dict, List, Optional, Sequence, Set
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:  # pragma: no cover - optional dependency
+    import orjson
+except ImportError:
+    orjson = None
 
 from dotenv import load_dotenv
 from telethon import TelegramClient, events
@@ -25,8 +33,18 @@ from .sheets_logger import GoogleSheetLogger, MessageRecord
 
 logger = logging.getLogger(__name__)
 
+_UTC = ZoneInfo("UTC")
+_WATCH_RE = re.compile(r"^!watch\s+(-?\d+)", re.IGNORECASE)
+_KEYWORD_SPLIT_RE = re.compile(r"[,\n;]+")
+
+# Chat display names are cached per chat with a TTL so a rename is picked
+# up within minutes; ChatAction events additionally invalidate the entry
+# immediately. Eviction is per entry, never a full wipe.
+_CHAT_NAME_TTL = 900.0
+_CHAT_NAME_CACHE_MAX = 1024
 
-@dataclass
+
+@dataclass(slots=True)
 class PendingRuleSession:
     origin_chat_id: int
     requested_by: int
@@ -44,6 +62,10 @@ def configure_logging(
     max_bytes: int,
     backup_count: int,
 ) -> None:
+    if logging.getLogger().handlers:
+        # Already configured (re-runs, test harnesses importing run()).
+        return
+
     log_level = getattr(logging, level.upper(), logging.INFO)
     handlers: List[logging.Handler] = [logging.StreamHandler()]
 
@@ -89,30 +111,196 @@ def _load_state_file(path: Path) -> Dict[str, Any]:
 
 
 def _save_state_file(path: Path, data: Dict[str, Any]) -> None:
+    if orjson is not None:
+        raw = orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    else:
+        raw = json.dumps(data, indent=2).encode("utf-8")
     try:
         path.parent.mkdir(parents=True, exist_ok=True)
-        path.write_text(json.dumps(data, indent=2), encoding="utf-8")
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_bytes(raw)
+        os.replace(tmp_path, path)
     except OSError as exc:
         logger.warning("Tidak dapat menulis state file '%s': %s", path, exc)
 
 
-def _build_message_link(chat_id: int, message_id: int) -> Optional[str]:
+@lru_cache(maxsize=1024)
+def _message_link_prefix(chat_id: int) -> Optional[str]:
     if chat_id >= 0:
         return None  # private chat, cannot build public link
     if str(chat_id).startswith("-100"):
         channel_id = str(chat_id)[4:]
     else:
         channel_id = str(chat_id)[1:]
-    return f"https://t.me/c/{channel_id}/{message_id}"
+    return f"https://t.me/c/{channel_id}/"
+
 
+def _build_message_link(chat_id: int, message_id: int) -> Optional[str]:
+    prefix = _message_link_prefix(chat_id)
+    if prefix is None:
+        return None
+    return f"{prefix}{message_id}"
+
+
+def _parse_keywords(raw: str) -> List[str]:
+    cleaned = raw.strip()
+    if not cleaned:
+        return []
+    if cleaned.lower() in {"-", "skip", "none"}:
+        return []
+    return [
+        part.strip()
+        for part in _KEYWORD_SPLIT_RE.split(cleaned)
+        if part.strip()
+    ]
+
+
+def _fmt_keywords(keywords: Sequence[str]) -> str:
+    return ", ".join(keywords) if keywords else "-"
+
+
+async def _handle_command(
+    event: events.NewMessage.Event,
+    message: Any,
+    chat_id: int,
+    session: Optional[PendingRuleSession],
+    pending_sessions: Dict[int, PendingRuleSession],
+    rule_repo: RuleRepository,
+    manual_chat_filter: Optional[frozenset],
+) -> bool:
+    """Process an outgoing message as a command or setup-session answer.
+
+    Returns True when the message was consumed by the command flow and must
+    not reach the rule engine; the saved-messages and command checks run
+    exactly once here.
+    """
+
+    text = message.text.strip()
+    is_command = text.startswith("!")
+    is_saved_messages = (
+        message.sender_id is not None and chat_id == message.sender_id
+    )
+
+    if not is_saved_messages:
+        if is_command and _WATCH_RE.match(text):
+            await event.client.send_message(
+                "me",
+                "Perintah !watch hanya boleh dijalankan dari Saved Messages (chat dengan diri sendiri)."
+                " Kirim ulang perintah di sana.",
+            )
+        return True
+
+    if is_command and session and text.lower() == "!cancel":
+        pending_sessions.pop(chat_id, None)
+        await event.respond("Setup watcher dibatalkan.")
+        return True
+
+    match = _WATCH_RE.match(text) if is_command else None
+    if match:
+        target_chat_id = int(match.group(1))
+        if session:
+            await event.respond(
+                "Setup watcher sebelumnya digantikan dengan permintaan baru."
+            )
+        session = PendingRuleSession(
+            origin_chat_id=chat_id,
+            requested_by=message.sender_id or 0,
+            target_chat_id=target_chat_id,
+        )
+        pending_sessions[chat_id] = session
+        note = ""
+        if manual_chat_filter and target_chat_id not in manual_chat_filter:
+            note = (
+                "\nCatatan: chat ini belum ada di WATCH_CHAT_IDS, "
+                "perbarui variabel tersebut agar pesan ikut dipantau."
+            )
+        await event.respond(
+            f"Mulai konfigurasi watcher untuk chat {target_chat_id}.\n"
+            "Langkah 1 dari 4 — kirim label rule (misal: Promo Gadget).\n"
+            "Ketik `!cancel` kapan saja untuk batal."
+            + note
+        )
+        return True
+
+    if session is None:
+        return False
+
+    if session.step == "label":
+        label = text
+        if not label:
+            await event.respond("Label tidak boleh kosong. Coba kirim lagi.")
+            return True
+        session.label = label
+        session.step = "include_all"
+        await event.respond(
+            "Langkah 2 dari 4 — sebutkan keyword wajib (include_all).\n"
+            "Pisahkan dengan koma atau baris baru. Kirim '-' jika tidak ada."
+        )
+        return True
+
+    if session.step == "include_all":
+        session.include_all = _parse_keywords(text)
+        session.step = "include_any"
+        prompt = (
+            "Langkah 3 dari 4 — keyword opsional (include_any).\n"
+            "Pisahkan dengan koma atau baris baru. Kirim '-' jika tidak ada."
+        )
+        if not session.include_all:
+            prompt += (
+                "\nCatatan: karena belum ada include_all, "
+                "minimal satu keyword harus diisi di langkah ini."
+            )
+        await event.respond(prompt)
+        return True
+
+    if session.step == "include_any":
+        keywords = _parse_keywords(text)
+        if not keywords and not session.include_all:
+            await event.respond(
+                "Minimal harus ada satu keyword. Masukkan keyword include_any "
+                "dipisahkan koma."
+            )
+            return True
+        session.include_any = keywords
+        session.step = "exclude"
+        await event.respond(
+            "Langkah 4 dari 4 — keyword pengecualian (exclude).\n"
+            "Pisahkan dengan koma atau kirim '-' jika tidak ada."
+        )
+        return True
+
+    if session.step == "exclude":
+        session.exclude = _parse_keywords(text)
+        new_rule = Rule(
+            label=session.label or "",
+            include_all=session.include_all,
+            include_any=session.include_any,
+            exclude=session.exclude,
+            chat_ids={session.target_chat_id},
+        )
+        rule_repo.add_rule(new_rule)
+        pending_sessions.pop(chat_id, None)
+        logger.info(
+            "Rule baru ditambahkan: label='%s' target_chat=%s",
+            new_rule.label,
+            session.target_chat_id,
+        )
+        summary_lines = [
+            f"Watcher baru tersimpan untuk chat {session.target_chat_id}:",
+            f"- Label: {new_rule.label}",
+            f"- include_all: {_fmt_keywords(new_rule.include_all)}",
+            f"- include_any: {_fmt_keywords(new_rule.include_any)}",
+            f"- exclude: {_fmt_keywords(new_rule.exclude)}",
+        ]
+        if manual_chat_filter and session.target_chat_id not in manual_chat_filter:
+            summary_lines.append(
+                "- Catatan: chat ini belum ada di WATCH_CHAT_IDS, "
+                "perbarui env bila ingin dipantau."
+            )
+        await event.respond("\n".join(summary_lines))
+        return True
 
-def _matched_keywords(rule: Rule, text: str) -> Sequence[str]:
-    normalized = text.casefold()
-    found = []
-    for keyword in list(rule.include_all) + list(rule.include_any):
-        if keyword.casefold() in normalized:
-            found.append(keyword)
-    return found
+    return False
 
 
 async def run(settings: Settings) -> None:
@@ -126,9 +314,8 @@ async def run(settings: Settings) -> None:
     rule_repo = RuleRepository(settings.rules_file)
     rule_set: RuleSet = rule_repo.ruleset
 
-    manual_chat_filter: Optional[Set[int]] = (
-        set(settings.watch_chat_ids) if settings.watch_chat_ids else None
-    )
+    # Settings already holds an immutable frozenset; reuse it as-is.
+    manual_chat_filter = settings.watch_chat_ids
 
     client = TelegramClient(
         StringSession(settings.string_session), settings.api_id, settings.api_hash
@@ -137,7 +324,7 @@ async def run(settings: Settings) -> None:
     state = _load_state_file(settings.state_file)
     active_spreadsheet_id = settings.spreadsheet_id or state.get("spreadsheet_id")
 
-    sheet_logger = GoogleSheetLogger(
+    sheet_logger = await GoogleSheetLogger.create(
         service_account_file=str(settings.google_service_account_file),
         spreadsheet_id=active_spreadsheet_id,
         worksheet_name=settings.worksheet_name,
@@ -166,14 +353,17 @@ async def run(settings: Settings) -> None:
             sheet_logger.spreadsheet_id,
         )
 
-    try:
-        timezone = ZoneInfo(settings.timezone)
-    except ZoneInfoNotFoundError:
-        logger.warning(
-            "Timezone '%s' tidak ditemukan. Menggunakan UTC.",
-            settings.timezone,
-        )
-        timezone = ZoneInfo("UTC")
+    if settings.timezone.upper() == "UTC":
+        timezone = _UTC
+    else:
+        try:
+            timezone = ZoneInfo(settings.timezone)
+        except ZoneInfoNotFoundError:
+            logger.warning(
+                "Timezone '%s' tidak ditemukan. Menggunakan UTC.",
+                settings.timezone,
+            )
+            timezone = _UTC
 
     await client.connect()
     if not await client.is_user_authorized():
@@ -197,21 +387,15 @@ async def run(settings: Settings) -> None:
         logger.info("Listening on all accessible chats.")
 
     pending_sessions: Dict[int, PendingRuleSession] = {}
+    # chat_id -> (display name, monotonic expiry)
+    chat_name_cache: Dict[int, Tuple[str, float]] = {}
 
-    def _parse_keywords(raw: str) -> List[str]:
-        cleaned = raw.strip()
-        if not cleaned:
-            return []
-        if cleaned.lower() in {"-", "skip", "none"}:
-            return []
-        return [
-            part.strip()
-            for part in re.split(r"[,\n;]+", cleaned)
-            if part.strip()
-        ]
-
-    def _fmt_keywords(keywords: Sequence[str]) -> str:
-        return ", ".join(keywords) if keywords else "-"
+    @client.on(events.ChatAction())
+    async def chat_action_handler(event: events.ChatAction.Event) -> None:
+        # Title edits (and other chat changes) arrive here; drop the cached
+        # name so the next matched message re-resolves it immediately.
+        if event.chat_id is not None:
+            chat_name_cache.pop(event.chat_id, None)
 
     @client.on(events.NewMessage())
     async def handler(event: events.NewMessage.Event) -> None:
@@ -220,152 +404,63 @@ async def run(settings: Settings) -> None:
             return
 
         chat_id = event.chat_id if event.chat_id is not None else 0
-        text = message.text.strip()
-        session = pending_sessions.get(chat_id)
-        is_saved_messages = (
-            message.sender_id is not None and chat_id == message.sender_id
-        )
-
-        if message.out and not is_saved_messages:
-            if re.match(r"^!watch\s+(-?\d+)", text, flags=re.IGNORECASE):
-                await event.client.send_message(
-                    "me",
-                    "Perintah !watch hanya boleh dijalankan dari Saved Messages (chat dengan diri sendiri)."
-                    " Kirim ulang perintah di sana.",
-                )
-            return
-
-        if message.out and session and text.lower() == "!cancel":
-            pending_sessions.pop(chat_id, None)
-            await event.respond("Setup watcher dibatalkan.")
-            return
-
-        if message.out:
-            match = re.match(r"^!watch\s+(-?\d+)", text, flags=re.IGNORECASE)
-            if match:
-                target_chat_id = int(match.group(1))
-                if session:
-                    await event.respond(
-                        "Setup watcher sebelumnya digantikan dengan permintaan baru."
-                    )
-                session = PendingRuleSession(
-                    origin_chat_id=chat_id,
-                    requested_by=message.sender_id or 0,
-                    target_chat_id=target_chat_id,
-                )
-                pending_sessions[chat_id] = session
-                note = ""
-                if manual_chat_filter and target_chat_id not in manual_chat_filter:
-                    note = (
-                        "\nCatatan: chat ini belum ada di WATCH_CHAT_IDS, "
-                        "perbarui variabel tersebut agar pesan ikut dipantau."
-                    )
-                await event.respond(
-                    f"Mulai konfigurasi watcher untuk chat {target_chat_id}.\n"
-                    "Langkah 1 dari 4 — kirim label rule (misal: Promo Gadget).\n"
-                    "Ketik `!cancel` kapan saja untuk batal."
-                    + note
-                )
-                return
-
-        if message.out and session:
-            if session.step == "label":
-                label = text
-                if not label:
-                    await event.respond("Label tidak boleh kosong. Coba kirim lagi.")
-                    return
-                session.label = label
-                session.step = "include_all"
-                await event.respond(
-                    "Langkah 2 dari 4 — sebutkan keyword wajib (include_all).\n"
-                    "Pisahkan dengan koma atau baris baru. Kirim '-' jika tidak ada."
-                )
-                return
-
-            if session.step == "include_all":
-                session.include_all = _parse_keywords(text)
-                session.step = "include_any"
-                prompt = (
-                    "Langkah 3 dari 4 — keyword opsional (include_any).\n"
-                    "Pisahkan dengan koma atau baris baru. Kirim '-' jika tidak ada."
-                )
-                if not session.include_all:
-                    prompt += (
-                        "\nCatatan: karena belum ada include_all, "
-                        "minimal satu keyword harus diisi di langkah ini."
-                    )
-                await event.respond(prompt)
-                return
-
-            if session.step == "include_any":
-                keywords = _parse_keywords(text)
-                if not keywords and not session.include_all:
-                    await event.respond(
-                        "Minimal harus ada satu keyword. Masukkan keyword include_any "
-                        "dipisahkan koma."
-                    )
-                    return
-                session.include_any = keywords
-                session.step = "exclude"
-                await event.respond(
-                    "Langkah 4 dari 4 — keyword pengecualian (exclude).\n"
-                    "Pisahkan dengan koma atau kirim '-' jika tidak ada."
-                )
-                return
-
-            if session.step == "exclude":
-                session.exclude = _parse_keywords(text)
-                new_rule = Rule(
-                    label=session.label or "",
-                    include_all=session.include_all,
-                    include_any=session.include_any,
-                    exclude=session.exclude,
-                    chat_ids={session.target_chat_id},
-                )
-                rule_repo.add_rule(new_rule)
-                pending_sessions.pop(chat_id, None)
-                logger.info(
-                    "Rule baru ditambahkan: label='%s' target_chat=%s",
-                    new_rule.label,
-                    session.target_chat_id,
-                )
-                summary_lines = [
-                    f"Watcher baru tersimpan untuk chat {session.target_chat_id}:",
-                    f"- Label: {new_rule.label}",
-                    f"- include_all: {_fmt_keywords(new_rule.include_all)}",
-                    f"- include_any: {_fmt_keywords(new_rule.include_any)}",
-                    f"- exclude: {_fmt_keywords(new_rule.exclude)}",
-                ]
-                if manual_chat_filter and session.target_chat_id not in manual_chat_filter:
-                    summary_lines.append(
-                        "- Catatan: chat ini belum ada di WATCH_CHAT_IDS, "
-                        "perbarui env bila ingin dipantau."
-                    )
-                await event.respond("\n".join(summary_lines))
-                return
-
-        if manual_chat_filter and chat_id not in manual_chat_filter:
+        # pending_sessions is almost always empty; skip the hash lookup then.
+        session = pending_sessions.get(chat_id) if pending_sessions else None
+
+        # Outgoing messages are the only ones that can carry commands or
+        # setup-session answers; everything consumed there stops here.
+        if message.out and await _handle_command(
+            event,
+            message,
+            chat_id,
+            session,
+            pending_sessions,
+            rule_repo,
+            manual_chat_filter,
+        ):
             return
 
+        # Cheap local predicates first: everything below here costs network
+        # round-trips, so bail out before any await for filtered messages.
         rule_chat_filter = rule_set.chat_ids
-        if rule_chat_filter is not None and chat_id not in rule_chat_filter:
-            return
-
-        if settings.ignore_self_messages and message.out:
-            return
-
         if (
-            settings.ignore_bot_messages
-            and message.sender
-            and getattr(message.sender, "bot", False)
+            (manual_chat_filter and chat_id not in manual_chat_filter)
+            or (rule_chat_filter is not None and chat_id not in rule_chat_filter)
+            or (settings.ignore_self_messages and message.out)
+            or (
+                settings.ignore_bot_messages
+                and message.sender
+                and getattr(message.sender, "bot", False)
+            )
         ):
             return
 
-        matches = rule_set.match(chat_id, message.text)
+        # Casefold the body exactly once per message; match() reuses it for
+        # both rule evaluation and matched-keyword extraction.
+        normalized_text = message.text.casefold()
+        matches = rule_set.match(chat_id, message.text, normalized=normalized_text)
         if not matches:
             return
 
-        chat = await event.get_chat()
+        now = time.monotonic()
+        cached = chat_name_cache.get(chat_id)
+        if cached is not None and cached[1] > now:
+            chat_name = cached[0]
+        else:
+            chat = await event.get_chat()
+            chat_name = get_display_name(chat)
+            if len(chat_name_cache) >= _CHAT_NAME_CACHE_MAX and chat_id not in chat_name_cache:
+                # Drop expired entries first; if everything is still fresh,
+                # evict the oldest insertion instead of wiping hot chats.
+                for stale_id in [
+                    cid
+                    for cid, (_, expiry) in chat_name_cache.items()
+                    if expiry <= now
+                ]:
+                    del chat_name_cache[stale_id]
+                if len(chat_name_cache) >= _CHAT_NAME_CACHE_MAX:
+                    chat_name_cache.pop(next(iter(chat_name_cache)))
+            chat_name_cache[chat_id] = (chat_name, now + _CHAT_NAME_TTL)
 
         username = (
             message.sender.username if message.sender and message.sender.username else None
@@ -374,13 +469,12 @@ async def run(settings: Settings) -> None:
             get_display_name(message.sender) if message.sender else None
         )
         telegram_id = message.sender_id
-        chat_name = get_display_name(chat)
         link = _build_message_link(chat_id, message.id)
-        timestamp_utc = datetime.utcnow().replace(tzinfo=ZoneInfo("UTC"))
+        timestamp_utc = datetime.now(_UTC)
         timestamp_local = timestamp_utc.astimezone(timezone)
 
-        for rule in matches:
-            record = MessageRecord(
+        records = [
+            MessageRecord(
                 label=rule.label,
                 chat_id=chat_id,
                 chat_name=chat_name,
@@ -390,34 +484,40 @@ async def run(settings: Settings) -> None:
                 message_id=message.id,
                 message_text=message.text,
                 message_link=link,
-                matched_keywords=_matched_keywords(rule, message.text),
+                matched_keywords=matched_keywords,
                 excluded_keywords=list(rule.exclude),
                 timestamp_utc=timestamp_utc,
                 timestamp_local=timestamp_local,
             )
-            try:
-                await sheet_logger.append(record)
-                logger.info(
-                    "Logged message %s dari %s rule='%s'",
-                    message.id,
-                    chat_name,
-                    rule.label,
-                )
-            except Exception as exc:  # pragma: no cover - external API
-                logger.exception(
-                    "Gagal menulis ke Google Sheets untuk message %s: %s",
-                    message.id,
-                    exc,
-                )
-
-    await client.run_until_disconnected()
+            for rule, matched_keywords in matches
+        ]
+        # Hand off to the logger's background flusher; the handler never
+        # blocks on Sheets latency.
+        await sheet_logger.append_many(records)
+        if logger.isEnabledFor(logging.INFO):
+            # Guarded: building the label list is wasted work at
+            # LOG_LEVEL=WARNING and this runs for every matched message.
+            logger.info(
+                "Queued message %s dari %s rules=%s",
+                message.id,
+                chat_name,
+                [rule.label for rule, _ in matches],
+            )
+
+    try:
+        await client.run_until_disconnected()
+    finally:
+        # Flush whatever is still queued before exiting.
+        await sheet_logger.aclose()
 
 
 def main() -> None:
     root_dir = Path(__file__).resolve().parents[2]
     env_path = root_dir / ".env"
-    load_dotenv(dotenv_path=env_path, override=False)
-    load_dotenv(override=False)  # fallback to local .env in cwd
+    if env_path.exists():
+        load_dotenv(dotenv_path=env_path, override=False)
+    else:
+        load_dotenv(override=False)  # fallback to local .env in cwd
 
     try:
         settings = load_settings()
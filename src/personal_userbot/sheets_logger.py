@@ -3,21 +3,110 @@
 from __future__ import annotations
 
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+import json
 import logging
-from dataclasses import dataclass
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Any, Dict, List, Optional, Sequence, Tuple
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+from urllib.parse import quote
 
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
+# gspread (and the google-auth/requests stack underneath it) is imported
+# lazily inside _authorize so importing this module stays cheap; the
+# helpers below re-import it from sys.modules, which is a dict lookup.
+if TYPE_CHECKING:
+    import gspread
 
 logger = logging.getLogger(__name__)
 
+# Quota (429) and transient server errors are retried with exponential
+# backoff; anything else propagates immediately.
+_RETRYABLE_STATUS = frozenset({429, 500, 502, 503, 504})
+_MAX_ATTEMPTS = 6
+
 SCOPES = (
     "https://www.googleapis.com/auth/spreadsheets",
     "https://www.googleapis.com/auth/drive",
 )
 
+# Background flusher batching: write when this many records are queued, or
+# when this much time has passed since the first queued record.
+_FLUSH_BATCH_MAX = 100
+_FLUSH_MAX_DELAY = 1.0
+
+# Bounded ingest queue: when it fills up (sustained 429s, Sheets down)
+# overflow rows go to a local JSONL spill file instead of growing RSS,
+# and a replay task re-enqueues them once the queue has headroom again.
+_QUEUE_MAX = 10_000
+_QUEUE_LOW_WATER = 1_000
+_SPILL_REPLAY_INTERVAL = 30.0
+
+# Circuit breaker: after this many consecutive failed flushes the logger
+# stops queueing and writes straight to the spill file for a while, so
+# the ingest loop keeps moving while Sheets is down or throttled hard.
+_CIRCUIT_FAILURE_THRESHOLD = 3
+_CIRCUIT_OPEN_SECONDS = 60.0
+
+# Single-flight guard for worksheet setup: instantiating the logger twice
+# in one process (tests, hot reload) must not race spreadsheet creation
+# or spend quota repeating the header round-trips.
+_WORKSHEET_CACHE: Dict[Tuple[str, str], Tuple[str, "gspread.Worksheet"]] = {}
+_CONNECT_LOCK = threading.Lock()
+
+def _retry_delay(exc: Exception, attempt: int) -> Optional[float]:
+    """Return the backoff before retrying `exc`, or None if not retryable.
+
+    Honors a server-supplied Retry-After header when present, otherwise
+    exponential backoff capped at 60s plus jitter.
+    """
+
+    response = getattr(exc, "response", None)
+    if getattr(response, "status_code", None) not in _RETRYABLE_STATUS:
+        return None
+    retry_after = response.headers.get("Retry-After")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return min(60.0, 2.0 ** attempt) + random.uniform(0, 1)
+
+
+def _call_with_retry_sync(fn: Callable, *args, **kwargs):
+    """Run a gspread call, retrying 429/5xx with backoff (blocking)."""
+
+    import gspread
+
+    for attempt in range(_MAX_ATTEMPTS):
+        try:
+            return fn(*args, **kwargs)
+        except gspread.exceptions.APIError as exc:
+            delay = _retry_delay(exc, attempt)
+            if delay is None or attempt == _MAX_ATTEMPTS - 1:
+                raise
+            logger.warning(
+                "Google Sheets API error (%s). Mencoba ulang dalam %.1f detik.",
+                getattr(exc.response, "status_code", "?"),
+                delay,
+            )
+            time.sleep(delay)
+
+
 HEADERS: Tuple[str, ...] = (
     "timestamp_utc",
     "timestamp_local",
@@ -33,9 +122,64 @@ HEADERS: Tuple[str, ...] = (
     "matched_keywords",
     "excluded_keywords",
 )
+# List form used for comparisons against row_values() output, built once.
+_HEADERS_LIST: List[str] = list(HEADERS)
 
+# Sheets caps a cell at 50k characters; clip long messages client-side so
+# oversized pastes do not bloat request bodies or fail the whole batch.
+MAX_CELL_CHARS = 50_000
 
-@dataclass(frozen=True)
+
+class _TokenBucket:
+    """Async token bucket gating Sheets writes below the API quota.
+
+    Refills continuously at `rate` tokens per second up to `capacity`;
+    acquire() sleeps until a token is available. Only awaited from the
+    single flusher task, so no locking is needed.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated: Optional[float] = None
+
+    async def acquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if self._updated is not None:
+            self._tokens = min(
+                self._capacity, self._tokens + (now - self._updated) * self._rate
+            )
+        self._updated = now
+        if self._tokens < 1.0:
+            await asyncio.sleep((1.0 - self._tokens) / self._rate)
+            self._updated = loop.time()
+            self._tokens = 1.0
+        self._tokens -= 1.0
+
+
+@lru_cache(maxsize=256)
+def _iso(timestamp: datetime, tz_key: str) -> str:
+    """Memoized isoformat; records from one batch share timestamps.
+
+    Aware datetimes hash and compare by instant, ignoring tzinfo, so a
+    record's UTC and local timestamps would collide on the timestamp
+    alone and the local column would silently receive the UTC string.
+    The caller passes str(tzinfo) to keep the cache key timezone-aware.
+    """
+
+    return timestamp.isoformat()
+
+
+@lru_cache(maxsize=1024)
+def _join_keywords(keywords: Tuple[str, ...]) -> str:
+    """Memoized keyword join; records from one rule share the same set."""
+
+    return ", ".join(keywords)
+
+
+@dataclass(frozen=True, slots=True)
 class MessageRecord:
     """Normalized message payload sent to Google Sheets."""
 
@@ -52,24 +196,50 @@ class MessageRecord:
     excluded_keywords: Sequence[str]
     timestamp_utc: datetime
     timestamp_local: datetime
+    # Row representation built once at construction; records are immutable,
+    # so flushes (and retry replays) just read the cached tuple. The joined
+    # keyword strings are frozen separately so they are never recomputed
+    # even if the row is rebuilt or the fields are read directly.
+    _matched_joined: str = field(init=False, repr=False, compare=False)
+    _excluded_joined: str = field(init=False, repr=False, compare=False)
+    _row: Tuple[Any, ...] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        if len(self.message_text) > MAX_CELL_CHARS:
+            object.__setattr__(
+                self,
+                "message_text",
+                self.message_text[: MAX_CELL_CHARS - 1] + "…",
+            )
+        object.__setattr__(
+            self, "_matched_joined", _join_keywords(tuple(self.matched_keywords))
+        )
+        object.__setattr__(
+            self, "_excluded_joined", _join_keywords(tuple(self.excluded_keywords))
+        )
+        object.__setattr__(
+            self,
+            "_row",
+            (
+                _iso(self.timestamp_utc, str(self.timestamp_utc.tzinfo)),
+                _iso(self.timestamp_local, str(self.timestamp_local.tzinfo)),
+                self.label,
+                self.chat_name,
+                self.chat_id,
+                self.message_id,
+                self.message_link or "",
+                self.username or "",
+                self.display_name or "",
+                self.telegram_id or "",
+                self.message_text,
+                self._matched_joined,
+                self._excluded_joined,
+            ),
+        )
 
-    def as_row(self) -> List[Any]:
+    def as_row(self) -> Tuple[Any, ...]:
         """Return the row representation for gspread."""
-        return [
-            self.timestamp_utc.isoformat(),
-            self.timestamp_local.isoformat(),
-            self.label,
-            self.chat_name,
-            self.chat_id,
-            self.message_id,
-            self.message_link or "",
-            self.username or "",
-            self.display_name or "",
-            self.telegram_id or "",
-            self.message_text,
-            ", ".join(self.matched_keywords),
-            ", ".join(self.excluded_keywords),
-        ]
+        return self._row
 
 
 class GoogleSheetLogger:
@@ -82,29 +252,162 @@ class GoogleSheetLogger:
         spreadsheet_id: Optional[str],
         worksheet_name: str,
         spreadsheet_title: str,
+        writes_per_minute: int = 60,
+        spill_file: str | Path = "sheets_spill.jsonl",
+        _client: Optional["gspread.Client"] = None,
+        _spreadsheet: Optional["gspread.Spreadsheet"] = None,
+        _header_row: Optional[List[str]] = None,
     ) -> None:
         self._service_account_file = service_account_file
         self._worksheet_name = worksheet_name
         self._spreadsheet_title = spreadsheet_title
-        self._client = self._authorize(service_account_file)
+        self._bucket = _TokenBucket(
+            rate=writes_per_minute / 60.0, capacity=writes_per_minute
+        )
+        self._client = (
+            _client if _client is not None else self._authorize(service_account_file)
+        )
+        self._session = self._client.http_client.session
         (
             self._spreadsheet_id,
             self._worksheet,
-        ) = self._connect(spreadsheet_id)
+        ) = self._connect(
+            spreadsheet_id, spreadsheet=_spreadsheet, header_row=_header_row
+        )
+        self._append_url = self._build_append_url()
+        self._queue: "asyncio.Queue[Optional[MessageRecord | Tuple[Any, ...]]]" = (
+            asyncio.Queue(maxsize=_QUEUE_MAX)
+        )
+        self._flusher: Optional[asyncio.Task] = None
+        self._replay: Optional[asyncio.Task] = None
+        self._spill_file = Path(spill_file)
+        self._spill_lock = threading.Lock()
+        self._circuit_open_until = 0.0
+        self._consecutive_failures = 0
+        # Dedicated pool for blocking gspread calls, so concurrent Sheets
+        # round-trips never queue behind unrelated to_thread work.
+        self._executor = ThreadPoolExecutor(
+            max_workers=8, thread_name_prefix="sheets"
+        )
 
     @staticmethod
     def _authorize(service_account_file: str):
-        credentials = ServiceAccountCredentials.from_json_keyfile_name(
-            service_account_file, scopes=SCOPES
+        import gspread
+        from google.oauth2.service_account import Credentials
+        from requests.adapters import HTTPAdapter
+
+        credentials = Credentials.from_service_account_file(
+            service_account_file, scopes=list(SCOPES)
+        )
+        client = gspread.authorize(credentials)
+        # Size the keep-alive pool for the executor so concurrent Sheets
+        # calls reuse TLS connections instead of re-handshaking.
+        client.http_client.session.mount(
+            "https://", HTTPAdapter(pool_connections=8, pool_maxsize=8)
+        )
+        return client
+
+    @classmethod
+    async def create(
+        cls,
+        *,
+        service_account_file: str,
+        spreadsheet_id: Optional[str],
+        worksheet_name: str,
+        spreadsheet_title: str,
+        writes_per_minute: int = 60,
+        spill_file: str | Path = "sheets_spill.jsonl",
+    ) -> "GoogleSheetLogger":
+        """Build a logger without blocking the event loop.
+
+        Authorization and worksheet setup are blocking HTTP, so they run
+        in threads; with a known spreadsheet id the spreadsheet metadata
+        and the header row are fetched concurrently, hiding one
+        round-trip of the cold start.
+        """
+
+        client = await asyncio.to_thread(cls._authorize, service_account_file)
+        spreadsheet = None
+        header_row = None
+        if spreadsheet_id:
+            spreadsheet, header_row = await asyncio.gather(
+                asyncio.to_thread(client.open_by_key, spreadsheet_id),
+                asyncio.to_thread(
+                    cls._fetch_header_row, client, spreadsheet_id, worksheet_name
+                ),
+            )
+        instance = await asyncio.to_thread(
+            cls,
+            service_account_file=service_account_file,
+            spreadsheet_id=spreadsheet_id,
+            worksheet_name=worksheet_name,
+            spreadsheet_title=spreadsheet_title,
+            writes_per_minute=writes_per_minute,
+            spill_file=spill_file,
+            _client=client,
+            _spreadsheet=spreadsheet,
+            _header_row=header_row,
         )
-        return gspread.authorize(credentials)
+        # Start the flusher and spill replay right away, so rows spilled
+        # by a previous run are delivered even if this run never appends.
+        instance._ensure_flusher()
+        return instance
+
+    @staticmethod
+    def _fetch_header_row(
+        client: "gspread.Client", spreadsheet_id: str, worksheet_name: str
+    ) -> Optional[List[str]]:
+        """Fetch row 1 of the worksheet, or None if it cannot be read."""
+
+        import gspread
+        from gspread.utils import absolute_range_name
+
+        try:
+            response = client.http_client.values_get(
+                spreadsheet_id, absolute_range_name(worksheet_name, "1:1")
+            )
+        except gspread.exceptions.APIError:
+            return None
+        values = response.get("values") or [[]]
+        return [str(value) for value in values[0]]
+
+    def _connect(
+        self,
+        spreadsheet_id: Optional[str],
+        *,
+        spreadsheet: Optional["gspread.Spreadsheet"] = None,
+        header_row: Optional[List[str]] = None,
+    ) -> Tuple[str, gspread.Worksheet]:
+        key = (spreadsheet_id or self._spreadsheet_title, self._worksheet_name)
+        with _CONNECT_LOCK:
+            cached = _WORKSHEET_CACHE.get(key)
+            if cached is not None:
+                logger.debug(
+                    "Menggunakan worksheet '%s' dari cache proses.",
+                    self._worksheet_name,
+                )
+                return cached
+            result = self._connect_uncached(
+                spreadsheet_id, spreadsheet=spreadsheet, header_row=header_row
+            )
+            _WORKSHEET_CACHE[key] = result
+            return result
+
+    def _connect_uncached(
+        self,
+        spreadsheet_id: Optional[str],
+        *,
+        spreadsheet: Optional["gspread.Spreadsheet"] = None,
+        header_row: Optional[List[str]] = None,
+    ) -> Tuple[str, gspread.Worksheet]:
+        import gspread
 
-    def _connect(self, spreadsheet_id: Optional[str]) -> Tuple[str, gspread.Worksheet]:
         if spreadsheet_id:
             logger.info(
                 "Menyambungkan ke spreadsheet yang sudah ada (%s).", spreadsheet_id
             )
-            spreadsheet = self._client.open_by_key(spreadsheet_id)
+            if spreadsheet is None:
+                spreadsheet = self._client.open_by_key(spreadsheet_id)
             created = False
         else:
             logger.info(
@@ -133,7 +436,7 @@ class GoogleSheetLogger:
                 )
                 created = True
 
-        self._ensure_headers(worksheet, new_sheet=created)
+        self._ensure_headers(worksheet, new_sheet=created, existing=header_row)
         return spreadsheet_id or spreadsheet.id, worksheet
 
     @property
@@ -144,40 +447,370 @@ class GoogleSheetLogger:
     def worksheet_name(self) -> str:
         return self._worksheet_name
 
-    def _ensure_headers(self, worksheet: gspread.Worksheet, *, new_sheet: bool) -> None:
-        try:
-            existing = worksheet.row_values(1)
-        except gspread.exceptions.APIError as exc:  # pragma: no cover - defensive
-            logger.warning("Gagal membaca header worksheet: %s", exc)
-            existing = []
+    def _ensure_headers(
+        self,
+        worksheet: gspread.Worksheet,
+        *,
+        new_sheet: bool,
+        existing: Optional[List[str]] = None,
+    ) -> None:
+        import gspread
 
-        sanitized = [value.strip() for value in existing]
-        if sanitized == list(HEADERS):
-            return
+        if not new_sheet:
+            if existing is None:
+                try:
+                    existing = _call_with_retry_sync(worksheet.row_values, 1)
+                except gspread.exceptions.APIError as exc:  # pragma: no cover - defensive
+                    logger.warning("Gagal membaca header worksheet: %s", exc)
+                    existing = []
+
+            sanitized = [value.strip() for value in existing]
+            if sanitized == _HEADERS_LIST:
+                return
+
+            if existing:
+                logger.warning(
+                    "Header worksheet '%s' berbeda dari format yang diharapkan. "
+                    "Baris pertama tidak diubah untuk menjaga data.",
+                    worksheet.title,
+                )
+                return
 
-        if existing and not new_sheet:
+        logger.info("Menginisialisasi header worksheet '%s'.", worksheet.title)
+        # One batchUpdate writes the header row and freezes it, instead of
+        # separate clear/append_row/freeze round-trips.
+        body = {
+            "requests": [
+                {
+                    "updateCells": {
+                        "rows": [
+                            {
+                                "values": [
+                                    {"userEnteredValue": {"stringValue": header}}
+                                    for header in HEADERS
+                                ]
+                            }
+                        ],
+                        "fields": "userEnteredValue",
+                        "start": {
+                            "sheetId": worksheet.id,
+                            "rowIndex": 0,
+                            "columnIndex": 0,
+                        },
+                    }
+                },
+                {
+                    "updateSheetProperties": {
+                        "properties": {
+                            "sheetId": worksheet.id,
+                            "gridProperties": {"frozenRowCount": 1},
+                        },
+                        "fields": "gridProperties.frozenRowCount",
+                    }
+                },
+            ]
+        }
+        _call_with_retry_sync(
+            self._client.http_client.batch_update, worksheet.spreadsheet.id, body
+        )
+
+    async def append(self, record: MessageRecord) -> None:
+        """Queue a record; the background flusher batches the API writes."""
+
+        if self._circuit_open():
+            await self._spill([record.as_row()])
+            return
+        self._ensure_flusher()
+        try:
+            self._queue.put_nowait(record)
+        except asyncio.QueueFull:
             logger.warning(
-                "Header worksheet '%s' berbeda dari format yang diharapkan. "
-                "Baris pertama tidak diubah untuk menjaga data.",
-                worksheet.title,
+                "Antrean Sheets penuh. Menulis baris ke spill lokal."
             )
+            await self._spill([record.as_row()])
+
+    async def append_many(self, records: Sequence[MessageRecord]) -> None:
+        """Queue several records for the background flusher."""
+
+        if not records:
             return
+        if self._circuit_open():
+            await self._spill([record.as_row() for record in records])
+            return
+        self._ensure_flusher()
+        overflow: List[Tuple[Any, ...]] = []
+        for record in records:
+            if overflow:
+                overflow.append(record.as_row())
+                continue
+            try:
+                self._queue.put_nowait(record)
+            except asyncio.QueueFull:
+                overflow.append(record.as_row())
+        if overflow:
+            logger.warning(
+                "Antrean Sheets penuh. Menulis %d baris ke spill lokal.",
+                len(overflow),
+            )
+            await self._spill(overflow)
 
-        logger.info("Menginisialisasi header worksheet '%s'.", worksheet.title)
-        worksheet.clear()
-        worksheet.append_row(HEADERS, value_input_option="USER_ENTERED")
-        try:
-            worksheet.freeze(rows=1)
-        except gspread.exceptions.APIError:  # pragma: no cover - optional capability
-            logger.debug("Tidak dapat melakukan freeze pada header worksheet.")
+    def _ensure_flusher(self) -> None:
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+            self._replay = asyncio.create_task(self._replay_loop())
 
-    async def append(self, record: MessageRecord) -> None:
-        """Append a record to the Google Sheet."""
+    async def _flush_loop(self) -> None:
+        """Drain the queue and write coalesced batches to the worksheet.
+
+        Up to _FLUSH_BATCH_MAX records, or whatever arrived within
+        _FLUSH_MAX_DELAY of the first one, become a single append_rows
+        call. A None sentinel flushes the rest and stops the loop.
+        """
+
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            record = await self._queue.get()
+            if record is None:
+                return
+            batch: List[MessageRecord | Tuple[Any, ...]] = [record]
+            deadline = loop.time() + _FLUSH_MAX_DELAY
+            while len(batch) < _FLUSH_BATCH_MAX:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    record = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if record is None:
+                    stopping = True
+                    break
+                batch.append(record)
+            await self._flush_batch(batch)
+
+    async def _call_with_retry(self, fn: Callable, *args, **kwargs):
+        """Run a gspread call in a thread, retrying 429/5xx with backoff."""
+
+        import gspread
+
+        loop = asyncio.get_running_loop()
+        for attempt in range(_MAX_ATTEMPTS):
+            try:
+                return await loop.run_in_executor(
+                    self._executor, partial(fn, *args, **kwargs)
+                )
+            except gspread.exceptions.APIError as exc:
+                delay = _retry_delay(exc, attempt)
+                if delay is None or attempt == _MAX_ATTEMPTS - 1:
+                    raise
+                logger.warning(
+                    "Google Sheets API error (%s). Mencoba ulang dalam %.1f detik.",
+                    getattr(exc.response, "status_code", "?"),
+                    delay,
+                )
+                await asyncio.sleep(delay)
+
+    def _build_append_url(self) -> str:
+        """Resolve the values.append endpoint for our worksheet once.
+
+        The target spreadsheet, worksheet, and column range never change at
+        runtime, so the fully quoted URL is computed here instead of per
+        flush.
+        """
+
+        from gspread.utils import absolute_range_name
 
-        row = record.as_row()
+        # absolute_range_name adds the A1-notation quoting the API needs
+        # for sheet names with spaces or special characters; quote() then
+        # only handles the URL layer.
+        last_column = chr(ord("A") + len(HEADERS) - 1)
+        cell_range = absolute_range_name(self._worksheet_name, f"A:{last_column}")
+        return (
+            "https://sheets.googleapis.com/v4/spreadsheets/"
+            f"{self._spreadsheet_id}/values/{quote(cell_range, safe='')}:append"
+        )
+
+    def _values_append(self, rows: Sequence[Sequence[Any]]) -> None:
+        """POST rows straight to the Sheets values.append endpoint.
+
+        Bypasses gspread's Worksheet wrapper, so the only blocking work on
+        the executor thread is the HTTP round-trip itself. A fully async
+        client (gspread_asyncio/aiohttp) would also drop the thread hop,
+        but batching already amortizes that to one hop per flush and this
+        keeps the dependency set unchanged.
+        """
+
+        import gspread
+
+        response = self._session.post(
+            self._append_url,
+            # includeValuesInResponse=false keeps Sheets from echoing the
+            # appended rows back, so the response stays a few bytes no
+            # matter how large the batch is.
+            params={
+                "valueInputOption": "USER_ENTERED",
+                "insertDataOption": "INSERT_ROWS",
+                "includeValuesInResponse": "false",
+            },
+            json={"values": [list(row) for row in rows]},
+        )
+        if not response.ok:
+            raise gspread.exceptions.APIError(response)
+
+    def _circuit_open(self) -> bool:
+        """Return True while the breaker keeps writes away from Sheets."""
+
+        return asyncio.get_running_loop().time() < self._circuit_open_until
+
+    async def _spill(self, rows: Sequence[Tuple[Any, ...]]) -> None:
+        """Append rows to the local spill file without blocking the loop."""
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._spill_rows, rows)
+
+    def _spill_rows(self, rows: Sequence[Tuple[Any, ...]]) -> None:
+        with self._spill_lock:
+            with self._spill_file.open("a", encoding="utf-8") as handle:
+                for row in rows:
+                    handle.write(
+                        json.dumps(list(row), ensure_ascii=False) + "\n"
+                    )
+
+    def _read_spill(self) -> Tuple[List[Tuple[Any, ...]], int]:
+        """Read spill rows without removing them.
+
+        Returns the parsed rows plus the number of lines read; the caller
+        drops those lines via _compact_spill only after the rows are back
+        in the queue, so a cancellation mid-replay can at worst duplicate
+        rows, never lose them.
+        """
+
+        with self._spill_lock:
+            if not self._spill_file.exists():
+                return [], 0
+            rows: List[Tuple[Any, ...]] = []
+            consumed = 0
+            with self._spill_file.open("r", encoding="utf-8") as handle:
+                for line in handle:
+                    consumed += 1
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        rows.append(tuple(json.loads(line)))
+                    except ValueError:  # pragma: no cover - corrupt line
+                        logger.warning("Baris spill tidak valid dilewati.")
+            return rows, consumed
+
+    def _compact_spill(
+        self, consumed: int, leftover: Sequence[Tuple[Any, ...]]
+    ) -> None:
+        """Drop the first `consumed` spill lines, re-writing `leftover` rows.
+
+        Lines appended after the matching _read_spill are preserved; the
+        rewrite goes through a .tmp + os.replace so a crash leaves either
+        the old or the new file, never a truncated one.
+        """
+
+        with self._spill_lock:
+            existing: List[str] = []
+            if self._spill_file.exists():
+                with self._spill_file.open("r", encoding="utf-8") as handle:
+                    existing = handle.readlines()
+            keep = [
+                json.dumps(list(row), ensure_ascii=False) + "\n"
+                for row in leftover
+            ] + existing[consumed:]
+            if keep:
+                tmp_file = self._spill_file.with_suffix(
+                    self._spill_file.suffix + ".tmp"
+                )
+                tmp_file.write_text("".join(keep), encoding="utf-8")
+                os.replace(tmp_file, self._spill_file)
+            elif self._spill_file.exists():
+                self._spill_file.unlink()
+
+    async def _replay_loop(self) -> None:
+        """Re-enqueue spilled rows once the queue has headroom again."""
+
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(_SPILL_REPLAY_INTERVAL)
+            if self._circuit_open() or self._queue.qsize() >= _QUEUE_LOW_WATER:
+                continue
+            try:
+                rows, consumed = await loop.run_in_executor(
+                    self._executor, self._read_spill
+                )
+            except OSError:  # pragma: no cover - disk failure
+                logger.exception("Gagal membaca spill lokal.")
+                continue
+            if not consumed:
+                continue
+            requeued = 0
+            for row in rows:
+                try:
+                    self._queue.put_nowait(row)
+                except asyncio.QueueFull:
+                    break
+                requeued += 1
+            try:
+                await loop.run_in_executor(
+                    self._executor,
+                    partial(self._compact_spill, consumed, rows[requeued:]),
+                )
+            except OSError:  # pragma: no cover - disk failure
+                logger.exception("Gagal memadatkan spill lokal.")
+            if requeued:
+                logger.info(
+                    "Memutar ulang %d baris dari spill lokal.", requeued
+                )
 
-        def _append():
-            logger.debug("Appending row to Google Sheets: %s", row)
-            self._worksheet.append_row(row, value_input_option="USER_ENTERED")
+    async def _flush_batch(
+        self, batch: Sequence[MessageRecord | Tuple[Any, ...]]
+    ) -> None:
+        rows = [
+            item.as_row() if isinstance(item, MessageRecord) else item
+            for item in batch
+        ]
+        try:
+            await self._bucket.acquire()
+            await self._call_with_retry(self._values_append, rows)
+            self._consecutive_failures = 0
+            logger.debug("Flushed %d baris ke Google Sheets.", len(rows))
+        except Exception as exc:  # pragma: no cover - external API
+            self._consecutive_failures += 1
+            if self._consecutive_failures >= _CIRCUIT_FAILURE_THRESHOLD:
+                self._circuit_open_until = (
+                    asyncio.get_running_loop().time() + _CIRCUIT_OPEN_SECONDS
+                )
+                logger.warning(
+                    "Google Sheets gagal %d kali berturut-turut. Menulis ke "
+                    "spill lokal selama %.0f detik.",
+                    self._consecutive_failures,
+                    _CIRCUIT_OPEN_SECONDS,
+                )
+            logger.exception(
+                "Gagal menulis %d baris ke Google Sheets: %s", len(rows), exc
+            )
+            try:
+                await self._spill(rows)
+            except OSError:  # pragma: no cover - disk failure
+                logger.exception("Gagal menulis %d baris ke spill lokal.", len(rows))
 
-        await asyncio.to_thread(_append)
+    async def aclose(self) -> None:
+        """Flush pending records and stop the flusher and executor."""
+
+        if self._replay is not None:
+            self._replay.cancel()
+            try:
+                await self._replay
+            except asyncio.CancelledError:
+                pass
+            self._replay = None
+        if self._flusher is not None:
+            await self._queue.put(None)
+            await self._flusher
+            self._flusher = None
+        self._executor.shutdown(wait=True)